@@ -1,18 +1,39 @@
 #!/usr/bin/env python3
 
+import argparse
+import bisect
+import gzip
 import hashlib
+import os
+import re
+import sqlite3
+import sys
+import zipfile
 from enum import Enum
-from sys import argv
+
+#py7zr 1.0 or later is optional, and only needed for .7z archives
+try:
+    import py7zr
+    from py7zr.io import Py7zIO, WriterFactory
+except ImportError:
+    py7zr = None
+    Py7zIO = WriterFactory = object
 
 #Class to represent a Gameboy ROM
 class ROM:
 
-    #Initializes the ROM object
-    def __init__(self, bytes):
-        hasher = hashlib.md5()
-        hasher.update(bytes)
-        self.hash = hasher.hexdigest()
+    #Initializes the ROM object, hashes is an (md5, sha1) tuple when the
+    #hashes were already computed while reading the ROM
+    def __init__(self, bytes, hashes=None):
+        if hashes is None:
+            hasher = hashlib.md5()
+            hasher.update(bytes)
+            hashes = hasher.hexdigest(), hashlib.sha1(bytes).hexdigest()
+        self.hash, self.sha1 = hashes
         self.data = [int(b) for b in bytes]
+        self.records = None
+        self.symbols = None
+        self.code_map = None
         self.header = {
             "good_header" : self._check_header(),
             "title" : self._check_title(),
@@ -85,6 +106,104 @@ class ROM:
         JAPAN = 0x00
         NON_JAPANESE = 0x01
 
+    #Cross-reference tables
+
+    #Opcodes that transfer control, and the kind of transfer
+    BRANCH_OPCODES = {
+        0x18 : "jr", 0x20 : "jr", 0x28 : "jr", 0x30 : "jr", 0x38 : "jr",
+        0xc2 : "jp", 0xc3 : "jp", 0xca : "jp", 0xd2 : "jp", 0xda : "jp",
+        0xc4 : "call", 0xcc : "call", 0xcd : "call", 0xd4 : "call",
+        0xdc : "call",
+        0xc7 : "rst", 0xcf : "rst", 0xd7 : "rst", 0xdf : "rst",
+        0xe7 : "rst", 0xef : "rst", 0xf7 : "rst", 0xff : "rst"
+    }
+
+    #Opcodes that access a fixed memory address, and the kind of access
+    MEMORY_OPCODES = {
+        0x08 : "write", 0xea : "write", 0xfa : "read",
+        0xe0 : "write", 0xf0 : "read"
+    }
+
+    #Opcodes that end a basic block: jumps and returns
+    BLOCK_END_OPCODES = frozenset([
+        0x18, 0x20, 0x28, 0x30, 0x38,
+        0xc2, 0xc3, 0xca, 0xd2, 0xda, 0xe9,
+        0xc0, 0xc8, 0xc9, 0xd0, 0xd8, 0xd9
+    ])
+
+    #Interrupt vectors, which start routines like call targets do
+    INTERRUPT_VECTORS = (0x40, 0x48, 0x50, 0x58, 0x60)
+
+    #Cycle tables
+
+    #Machine cycles of each opcode, taking the branch for conditional
+    #jr, jp, call and ret.  Invalid opcodes cost 0, and 0xcb is costed
+    #by CB_CYCLES.
+    CYCLES = [
+        1, 3, 2, 2, 1, 1, 2, 1, 5, 2, 2, 2, 1, 1, 2, 1,
+        1, 3, 2, 2, 1, 1, 2, 1, 3, 2, 2, 2, 1, 1, 2, 1,
+        3, 3, 2, 2, 1, 1, 2, 1, 3, 2, 2, 2, 1, 1, 2, 1,
+        3, 3, 2, 2, 3, 3, 3, 1, 3, 2, 2, 2, 1, 1, 2, 1,
+        1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 1, 1, 1, 2, 1,
+        1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 1, 1, 1, 2, 1,
+        1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 1, 1, 1, 2, 1,
+        2, 2, 2, 2, 2, 2, 1, 2, 1, 1, 1, 1, 1, 1, 2, 1,
+        1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 1, 1, 1, 2, 1,
+        1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 1, 1, 1, 2, 1,
+        1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 1, 1, 1, 2, 1,
+        1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 1, 1, 1, 2, 1,
+        5, 3, 4, 4, 6, 4, 2, 4, 5, 4, 4, 0, 6, 6, 2, 4,
+        5, 3, 4, 0, 6, 4, 2, 4, 5, 4, 4, 0, 6, 0, 2, 4,
+        3, 3, 2, 0, 0, 4, 2, 4, 4, 1, 4, 0, 0, 0, 2, 4,
+        3, 3, 2, 1, 0, 4, 2, 4, 3, 2, 4, 1, 0, 0, 2, 4
+    ]
+
+    #Machine cycles of each opcode when a conditional branch is not taken
+    CYCLES_NOT_TAKEN = [
+        1, 3, 2, 2, 1, 1, 2, 1, 5, 2, 2, 2, 1, 1, 2, 1,
+        1, 3, 2, 2, 1, 1, 2, 1, 3, 2, 2, 2, 1, 1, 2, 1,
+        2, 3, 2, 2, 1, 1, 2, 1, 2, 2, 2, 2, 1, 1, 2, 1,
+        2, 3, 2, 2, 3, 3, 3, 1, 2, 2, 2, 2, 1, 1, 2, 1,
+        1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 1, 1, 1, 2, 1,
+        1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 1, 1, 1, 2, 1,
+        1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 1, 1, 1, 2, 1,
+        2, 2, 2, 2, 2, 2, 1, 2, 1, 1, 1, 1, 1, 1, 2, 1,
+        1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 1, 1, 1, 2, 1,
+        1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 1, 1, 1, 2, 1,
+        1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 1, 1, 1, 2, 1,
+        1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 1, 1, 1, 2, 1,
+        2, 3, 3, 4, 3, 4, 2, 4, 2, 4, 3, 0, 3, 6, 2, 4,
+        2, 3, 3, 0, 3, 4, 2, 4, 2, 4, 3, 0, 3, 0, 2, 4,
+        3, 3, 2, 0, 0, 4, 2, 4, 4, 1, 4, 0, 0, 0, 2, 4,
+        3, 3, 2, 1, 0, 4, 2, 4, 3, 2, 4, 1, 0, 0, 2, 4
+    ]
+
+    #Machine cycles of each 0xcb prefixed opcode, including the prefix
+    CB_CYCLES = [
+        2, 2, 2, 2, 2, 2, 4, 2, 2, 2, 2, 2, 2, 2, 4, 2,
+        2, 2, 2, 2, 2, 2, 4, 2, 2, 2, 2, 2, 2, 2, 4, 2,
+        2, 2, 2, 2, 2, 2, 4, 2, 2, 2, 2, 2, 2, 2, 4, 2,
+        2, 2, 2, 2, 2, 2, 4, 2, 2, 2, 2, 2, 2, 2, 4, 2,
+        2, 2, 2, 2, 2, 2, 3, 2, 2, 2, 2, 2, 2, 2, 3, 2,
+        2, 2, 2, 2, 2, 2, 3, 2, 2, 2, 2, 2, 2, 2, 3, 2,
+        2, 2, 2, 2, 2, 2, 3, 2, 2, 2, 2, 2, 2, 2, 3, 2,
+        2, 2, 2, 2, 2, 2, 3, 2, 2, 2, 2, 2, 2, 2, 3, 2,
+        2, 2, 2, 2, 2, 2, 4, 2, 2, 2, 2, 2, 2, 2, 4, 2,
+        2, 2, 2, 2, 2, 2, 4, 2, 2, 2, 2, 2, 2, 2, 4, 2,
+        2, 2, 2, 2, 2, 2, 4, 2, 2, 2, 2, 2, 2, 2, 4, 2,
+        2, 2, 2, 2, 2, 2, 4, 2, 2, 2, 2, 2, 2, 2, 4, 2,
+        2, 2, 2, 2, 2, 2, 4, 2, 2, 2, 2, 2, 2, 2, 4, 2,
+        2, 2, 2, 2, 2, 2, 4, 2, 2, 2, 2, 2, 2, 2, 4, 2,
+        2, 2, 2, 2, 2, 2, 4, 2, 2, 2, 2, 2, 2, 2, 4, 2,
+        2, 2, 2, 2, 2, 2, 4, 2, 2, 2, 2, 2, 2, 2, 4, 2
+    ]
+
+    #Cycle annotation of each opcode and each 0xcb prefixed opcode, as
+    #written by --cycles
+    CYCLE_NOTES = [" [{}]".format(t) if t == n else " [{}/{}]".format(t, n)
+                   for t, n in zip(CYCLES, CYCLES_NOT_TAKEN)]
+    CB_CYCLE_NOTES = [" [{}]".format(c) for c in CB_CYCLES]
+
     #Helper functions
 
     #Converts a range in the ROM to an ascii string
@@ -170,14 +289,137 @@ class ROM:
         checksum = (sum(self.data) - sum(self.data[0x14E:0x150])) & 0xFFFF
         return checksum == (self.data[0x14E] << 8) + self.data[0x14F]
 
+    #Returns the bank and CPU address of an offset in the ROM
+    def _bank_address(self, offset):
+        if offset < 0x4000:
+            return 0, offset
+        return offset // 0x4000, 0x4000 + offset % 0x4000
+
+    #Returns the ROM offset of a CPU address in a bank
+    def _offset(self, bank, address):
+        if address < 0x4000:
+            return address
+        return bank * 0x4000 + address - 0x4000
+
+    #Returns the machine cycles of the instruction at offset as
+    #(taken, not_taken), which only differ for conditional branches
+    def cycles(self, offset):
+        opcode = self.data[offset]
+        if opcode == 0xcb:
+            cycles = self.CB_CYCLES[self.data[offset + 1]]
+            return cycles, cycles
+        return self.CYCLES[opcode], self.CYCLES_NOT_TAKEN[opcode]
+
+    #Returns the branch target of the instruction at offset as
+    #(kind, bank, address), or None if it does not branch
+    def _branch_target(self, offset):
+        opcode = self.data[offset]
+        kind = self.BRANCH_OPCODES.get(opcode)
+        if kind is None:
+            return None
+        bank, address = self._bank_address(offset)
+        if kind == "jr":
+            r8 = self.data[offset + 1]
+            target = (address + 2 + r8 - (r8 & 0x80) * 2) & 0xFFFF
+        elif kind == "rst":
+            target = opcode & 0x38
+        else:
+            target = (self.data[offset + 2] << 8) + self.data[offset + 1]
+        if target < 0x4000:
+            target_bank = 0
+        elif target < 0x8000 and bank > 0:
+            target_bank = bank
+        else:
+            target_bank = None
+        return kind, target_bank, target
+
+    #Returns the fixed memory address accessed by the instruction at
+    #offset as (access, address), or None if it has none
+    def _memory_target(self, offset):
+        opcode = self.data[offset]
+        access = self.MEMORY_OPCODES.get(opcode)
+        if access is None:
+            return None
+        if opcode == 0xe0 or opcode == 0xf0:
+            return access, 0xFF00 + self.data[offset + 1]
+        return access, (self.data[offset + 2] << 8) + self.data[offset + 1]
+
     #Disassembly helper functions
 
+    #Number of bytes on each db line
+    DATA_LINE_LENGTH = 16
+
     #Prints a message and increments the index by n
     def p_inc(self, message, n):
-        self.output.write(message + "\t;${:04X}\n".format(self.index))
+        if self.output is not None:
+            location = self._location()
+            if self.annotate_cycles:
+                opcode = self.data[self.index]
+                if opcode == 0xcb:
+                    location += self.CB_CYCLE_NOTES[self.data[self.index + 1]]
+                else:
+                    location += self.CYCLE_NOTES[opcode]
+            self.output.write(message + "\t;" + location + "\n")
+        if self.records is not None:
+            self.records.append((self.index, message, n))
 
         self.index += n
 
+    #Returns the index as a symbol+offset or $XXXX comment, writing a
+    #section comment and label first when they start at the index
+    def _location(self):
+        if self.symbols is not None:
+            bank, address = self._bank_address(self.index)
+            section = self.symbols.sections.get((bank << 16) | address)
+            if section is not None:
+                self.output.write('; SECTION "' + section + '"\n')
+            symbol = self.symbols.lookup(bank, address)
+            if symbol is not None:
+                if symbol[1] == 0:
+                    self.output.write(symbol[0] + ":\n")
+                return self.symbols.format(*symbol)
+        return "${:04X}".format(self.index)
+
+    #Writes the bytes up to end as db lines and moves the index to end
+    def _data_block(self, end):
+        if self.output is None:
+            self.index = end
+            return
+        while self.index < end:
+            n = min(self.DATA_LINE_LENGTH, end - self.index)
+            if self.symbols is not None:
+                #Ends the line at the next symbol or bank so that every
+                #label is written
+                bank, address = self._bank_address(self.index)
+                keys = self.symbols.keys
+                i = bisect.bisect_right(keys, (bank << 16) | address)
+                next_key = (bank << 16) | (0x8000 if bank else 0x4000)
+                if i < len(keys):
+                    next_key = min(next_key, keys[i])
+                n = min(n, (next_key & 0xFFFF) - address)
+            line = ", ".join("${:02X}".format(b)
+                             for b in self.data[self.index:self.index + n])
+            self.output.write("db " + line + "\t;" + self._location() + "\n")
+            self.index += n
+
+    #Returns the symbol for an address referenced by the current
+    #instruction, or None
+    def _symbol(self, address):
+        if address < 0x4000:
+            return self.symbols.resolve(0, address)
+        if address < 0x8000:
+            bank = self.index // 0x4000
+            if bank == 0:
+                #Only a 32 KByte ROM has a known bank here
+                if len(self.data) > 0x8000:
+                    return None
+                bank = 1
+            return self.symbols.resolve(bank, address)
+        symbol = self.symbols.resolve(0, address)
+        if symbol is None:
+            symbol = self.symbols.resolve(1, address)
+        return symbol
+
     def d8(self):
         return '${:02X}'.format(self.data[self.index + 1])
 
@@ -186,22 +428,39 @@ class ROM:
         return f.format(self.data[self.index + 2], self.data[self.index + 1])
     
     def a8(self):
+        if self.symbols is not None:
+            symbol = self._symbol(0xFF00 + self.data[self.index + 1])
+            if symbol is not None:
+                return symbol
         return self.d8()
 
     def a16(self):
+        if self.symbols is not None:
+            address = (self.data[self.index + 2] << 8) + self.data[self.index + 1]
+            symbol = self._symbol(address)
+            if symbol is not None:
+                return symbol
         return self.d16()
 
     def r8(self):
         return self.d8()
 
-    #Main entry point for disassembly
-    def disassemble(self, output):
-        self.output = output
-        
+    #The target of a jr
+    def j8(self):
+        if self.symbols is not None:
+            symbol = self._symbol(self._branch_target(self.index)[2])
+            if symbol is not None:
+                return symbol
+        return self.r8()
+
+    #Writes the hashes and header info as comments
+    def _write_header(self):
         self.output.write("; Disassembled with github.com/awjnsn/gbdump\n")
         
         self.output.write("; Cartridge MD5 Hash " + self.hash + "\n")
 
+        self.output.write("; Cartridge SHA1 Hash " + self.sha1 + "\n")
+
         self.output.write(";\n")
 
         self.output.write("; Cartridge header info:\n")
@@ -211,6 +470,22 @@ class ROM:
         
         self.output.write("\n")
 
+    #Main entry point for disassembly, output may be None when only
+    #self.records is wanted.  When self.records is a list, it is refilled
+    #with every decoded instruction.  With cycles, each line is annotated
+    #with its machine cycles, as [taken/not taken] for conditional
+    #branches.  With a SymbolTable, addresses are written as
+    #symbol+offset.
+    def disassemble(self, output, cycles=False, symbols=None):
+        self.output = output
+        self.annotate_cycles = cycles
+        self.symbols = symbols
+        if self.records is not None:
+            self.records = []
+        
+        if self.output is not None:
+            self._write_header()
+
         self.index = 0
 
         cb_instruction_table = {
@@ -515,7 +790,7 @@ class ROM:
             "0x15" : lambda: self.p_inc("dec D", 1),
             "0x16" : lambda: self.p_inc("ld D, " + self.d8(), 2),
             "0x17" : lambda: self.p_inc("rla", 1),
-            "0x18" : lambda: self.p_inc("jr " + self.r8(), 2),
+            "0x18" : lambda: self.p_inc("jr " + self.j8(), 2),
             "0x19" : lambda: self.p_inc("add HL, DE", 1),
             "0x1a" : lambda: self.p_inc("ld A, [DE]", 1),
             "0x1b" : lambda: self.p_inc("dec DE", 1),
@@ -524,7 +799,7 @@ class ROM:
             "0x1e" : lambda: self.p_inc("ld E, " + self.d8(), 2),
             "0x1f" : lambda: self.p_inc("rra", 1),
             
-            "0x20" : lambda: self.p_inc("jr NZ, " + self.d8(), 2),
+            "0x20" : lambda: self.p_inc("jr NZ, " + self.j8(), 2),
             "0x21" : lambda: self.p_inc("ld HL, " + self.d16(), 3),
             "0x22" : lambda: self.p_inc("ld [HL+], A", 1),
             "0x23" : lambda: self.p_inc("inc HL", 1),
@@ -532,7 +807,7 @@ class ROM:
             "0x25" : lambda: self.p_inc("dec H", 1),
             "0x26" : lambda: self.p_inc("ld H, " + self.d8(), 2),
             "0x27" : lambda: self.p_inc("daa", 1),
-            "0x28" : lambda: self.p_inc("jr Z, " + self.r8(), 2),
+            "0x28" : lambda: self.p_inc("jr Z, " + self.j8(), 2),
             "0x29" : lambda: self.p_inc("add HL, HL", 1),
             "0x2a" : lambda: self.p_inc("ld A, [HL+]", 1),
             "0x2b" : lambda: self.p_inc("dec HL", 1),
@@ -541,7 +816,7 @@ class ROM:
             "0x2e" : lambda: self.p_inc("ld L, " + self.d8(), 2),
             "0x2f" : lambda: self.p_inc("cpl", 1),
             
-            "0x30" : lambda: self.p_inc("jr NC, " + self.r8(), 2),
+            "0x30" : lambda: self.p_inc("jr NC, " + self.j8(), 2),
             "0x31" : lambda: self.p_inc("ld SP, " + self.d16(), 3),
             "0x32" : lambda: self.p_inc("ld [HL-], A", 1),
             "0x33" : lambda: self.p_inc("inc SP", 1),
@@ -549,7 +824,7 @@ class ROM:
             "0x35" : lambda: self.p_inc("dec [HL]", 1),
             "0x36" : lambda: self.p_inc("ld [HL], " + self.d8(), 2),
             "0x37" : lambda: self.p_inc("scf", 1),
-            "0x38" : lambda: self.p_inc("jr C, " + self.r8(), 2),
+            "0x38" : lambda: self.p_inc("jr C, " + self.j8(), 2),
             "0x39" : lambda: self.p_inc("add HL, SP", 1),
             "0x3a" : lambda: self.p_inc("ld A, [HL-]", 1),
             "0x3b" : lambda: self.p_inc("dec SP", 1),
@@ -705,7 +980,7 @@ class ROM:
             "0xc8" : lambda: self.p_inc("ret Z", 1),
             "0xc9" : lambda: self.p_inc("ret", 1),
             "0xca" : lambda: self.p_inc("jp Z, " + self.a16(), 3),
-            "0xcb" : cb_instruction_table[hex(self.data[self.index + 1])],
+            "0xcb" : lambda: cb_instruction_table[hex(self.data[self.index + 1])](),
             "0xcc" : lambda: self.p_inc("call Z, " + self.a16(), 3),
             "0xcd" : lambda: self.p_inc("call " + self.a16(), 3),
             "0xce" : lambda: self.p_inc("adc A, " + self.d8(), 2),
@@ -727,7 +1002,7 @@ class ROM:
             
             "0xe0" : lambda: self.p_inc("ldh [" + self.a8() + "], A", 2),
             "0xe1" : lambda: self.p_inc("pop HL", 1),
-            "0xe2" : lambda: self.p_inc("ld [C], A", 2), #Unsure why 2 long
+            "0xe2" : lambda: self.p_inc("ld [C], A", 1),
             "0xe5" : lambda: self.p_inc("push HL", 1),
             "0xe6" : lambda: self.p_inc("and " + self.d8(), 2),
             "0xe7" : lambda: self.p_inc("rst $20", 1),
@@ -739,7 +1014,7 @@ class ROM:
             
             "0xf0" : lambda: self.p_inc("ldh A, [" + self.a8() + "]", 2),
             "0xf1" : lambda: self.p_inc("pop AF", 1),
-            "0xf2" : lambda: self.p_inc("ld A, [C]", 2),
+            "0xf2" : lambda: self.p_inc("ld A, [C]", 1),
             "0xf3" : lambda: self.p_inc("di", 1),
             "0xf5" : lambda: self.p_inc("push af", 1),
             "0xf6" : lambda: self.p_inc("or " + self.d8(), 2),
@@ -757,27 +1032,1606 @@ class ROM:
             #Skip the header
             if self.index == 0x104:
                 self.index = 0x150
+                continue
+            #Write everything the code map does not mark as code as data
+            if self.code_map is not None and \
+                    not self.code_map.bitmap[self.index] & CodeDataLog.CODE:
+                end = self.code_map.next_code(self.index)
+                if self.index < 0x104 < end:
+                    end = 0x104
+                self._data_block(min(end, len(self.data)))
+                continue
             try:
                 instruction_table[hex(self.data[self.index])]()
             except KeyError:
-                self.output.write("; Misread instruction ")
-                self.output.write(hex(self.data[self.index]) + " at ")
-                self.output.write(hex(self.index) + "\n")
+                if self.output is not None:
+                    self.output.write("; Misread instruction ")
+                    self.output.write(hex(self.data[self.index]) + " at ")
+                    self.output.write(hex(self.index) + "\n")
                 self.index += 1
+
+    #Returns the decoded instructions, only decoding the ROM, with the
+    #symbols of the last pass, when no earlier pass filled self.records
+    def _decoded(self):
+        if self.records is None:
+            self.records = []
+            self.disassemble(None, symbols=self.symbols)
+        return self.records
+
+    #Timing report
+
+    #Formats a (taken, not_taken) cycle pair
+    def _format_cycles(self, taken, not_taken):
+        if taken == not_taken:
+            return str(taken)
+        return str(taken) + "/" + str(not_taken)
+
+    #Formats a ROM offset as bank:address
+    def _format_offset(self, offset):
+        return "{:02X}:${:04X}".format(*self._bank_address(offset))
+
+    #Returns the sorted ROM offsets that start routines: the entry
+    #point, interrupt vectors and every call or rst target
+    def _routine_starts(self, offsets):
+        starts = set([0x100])
+        starts.update(self.INTERRUPT_VECTORS)
+        for offset in offsets:
+            opcode = self.data[offset]
+            kind = self.BRANCH_OPCODES.get(opcode)
+            if kind == "call" or kind == "rst":
+                kind, bank, target = self._branch_target(offset)
+                if bank is not None:
+                    starts.add(self._offset(bank, target))
+        return sorted(s for s in starts if s in offsets)
+
+    #Writes the cycle totals of every routine and basic block, and the
+    #cost of one iteration of every loop, as comments.  Totals are for
+    #a straight run through the code, with the last jump of a block
+    #given as taken/not taken and conditional calls as not taken.
+    #Blocks inside a loop are marked.
+    def timing_report(self, output):
+        records = self._decoded()
+
+        offsets = {offset : i for i, (offset, text, n) in enumerate(records)}
+        routines = self._routine_starts(offsets)
+
+        #Leaders start basic blocks, back edges close loops
+        leaders = set(routines)
+        back_edges = []
+        for offset, text, n in records:
+            opcode = self.data[offset]
+            if opcode in self.BLOCK_END_OPCODES:
+                leaders.add(offset + n)
+            if opcode in self.BRANCH_OPCODES:
+                kind, bank, target = self._branch_target(offset)
+                if bank is not None:
+                    target = self._offset(bank, target)
+                    leaders.add(target)
+                    if target <= offset and target in offsets and \
+                            bisect.bisect_right(routines, target) == \
+                            bisect.bisect_right(routines, offset):
+                        back_edges.append((target, offset))
+
+        #Each loop body is the straight run from its target to its back
+        #edge, costed with the back edge taken
+        loops = {}
+        for target, offset in back_edges:
+            cycles = 0
+            for i in range(offsets[target], offsets[offset]):
+                cycles += self.cycles(records[i][0])[1]
+            cycles += self.cycles(offset)[0]
+            routine = bisect.bisect_right(routines, target)
+            loops.setdefault(routine, []).append((target, offset, cycles))
+
+        output.write("; Timing report, in machine cycles\n")
+
+        routine_index = 0
+        routine_loops = loops.get(0, [])
+        block = None
+        for i, (offset, text, n) in enumerate(records):
+            if routine_index < len(routines) and \
+                    offset == routines[routine_index]:
+                end = routines[routine_index + 1] \
+                    if routine_index + 1 < len(routines) else None
+                total = 0
+                count = 0
+                for j in range(i, len(records)):
+                    if records[j][0] == end:
+                        break
+                    total += self.cycles(records[j][0])[1]
+                    count += 1
+                output.write(";\n; Routine " + self._format_offset(offset)
+                             + "\t" + str(count) + " instructions\t"
+                             + str(total) + " cycles\n")
+                routine_index += 1
+                routine_loops = loops.get(routine_index, [])
+                for target, edge, cycles in routine_loops:
+                    output.write(";   Loop " + self._format_offset(target)
+                                 + "-" + self._format_offset(edge)
+                                 + "\t" + str(cycles)
+                                 + " cycles per iteration\n")
+
+            if block is None or offset in leaders:
+                block = offset
+                block_taken = 0
+                block_not_taken = 0
+
+            taken, not_taken = self.cycles(offset)
+            block_not_taken += not_taken
+            if self.data[offset] in self.BLOCK_END_OPCODES:
+                block_taken += taken
+            else:
+                block_taken += not_taken
+
+            if i + 1 == len(records) or records[i + 1][0] in leaders or \
+                    records[i + 1][0] != offset + n:
+                loop = any(t <= block and offset <= e
+                           for t, e, cycles in routine_loops)
+                output.write(";   Block " + self._format_offset(block)
+                             + "-" + self._format_offset(offset) + "\t"
+                             + self._format_cycles(block_taken,
+                                                   block_not_taken)
+                             + " cycles" + ("\tloop" if loop else "")
+                             + "\n")
+                block = None
+
+    #SQLite export
+
+    #Rows are inserted with executemany in batches of this size
+    SQLITE_BATCH_SIZE = 10000
+
+    #Converts a header value to something SQLite can store
+    def _sqlite_value(self, value):
+        if isinstance(value, Enum):
+            return value.name
+        if isinstance(value, bool):
+            return int(value)
+        return value
+
+    #Creates the tables and indexes if they do not exist yet
+    def _create_sqlite_schema(self, db):
+        header_columns = "".join(", " + k for k in self.header.keys())
+        db.execute("CREATE TABLE IF NOT EXISTS roms ("
+                   "id INTEGER PRIMARY KEY, md5 TEXT UNIQUE NOT NULL, "
+                   "sha1 TEXT NOT NULL, path TEXT, size INTEGER"
+                   + header_columns + ")")
+        db.execute("CREATE TABLE IF NOT EXISTS instructions ("
+                   "rom_id INTEGER NOT NULL REFERENCES roms(id), "
+                   "offset INTEGER NOT NULL, bank INTEGER NOT NULL, "
+                   "address INTEGER NOT NULL, opcode INTEGER NOT NULL, "
+                   "operand BLOB, length INTEGER NOT NULL, text TEXT)")
+        db.execute("CREATE TABLE IF NOT EXISTS branches ("
+                   "rom_id INTEGER NOT NULL REFERENCES roms(id), "
+                   "offset INTEGER NOT NULL, bank INTEGER NOT NULL, "
+                   "kind TEXT NOT NULL, target_bank INTEGER, "
+                   "target INTEGER NOT NULL)")
+        db.execute("CREATE TABLE IF NOT EXISTS memory_refs ("
+                   "rom_id INTEGER NOT NULL REFERENCES roms(id), "
+                   "offset INTEGER NOT NULL, bank INTEGER NOT NULL, "
+                   "access TEXT NOT NULL, target INTEGER NOT NULL)")
+        db.execute("CREATE INDEX IF NOT EXISTS roms_cartridge_type "
+                   "ON roms(cartridge_type)")
+        db.execute("CREATE UNIQUE INDEX IF NOT EXISTS instructions_offset "
+                   "ON instructions(rom_id, offset)")
+        db.execute("CREATE INDEX IF NOT EXISTS instructions_opcode "
+                   "ON instructions(opcode, bank)")
+        db.execute("CREATE INDEX IF NOT EXISTS branches_offset "
+                   "ON branches(rom_id, offset)")
+        db.execute("CREATE INDEX IF NOT EXISTS branches_target "
+                   "ON branches(target, target_bank)")
+        db.execute("CREATE INDEX IF NOT EXISTS memory_refs_offset "
+                   "ON memory_refs(rom_id, offset)")
+        db.execute("CREATE INDEX IF NOT EXISTS memory_refs_target "
+                   "ON memory_refs(target, access, bank)")
+
+    #Inserts rows with executemany, SQLITE_BATCH_SIZE rows at a time
+    def _sqlite_insert(self, db, statement, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.SQLITE_BATCH_SIZE:
+                db.executemany(statement, batch)
+                batch = []
+        if batch:
+            db.executemany(statement, batch)
+
+    #Yields an instructions row for every decoded instruction
+    def _instruction_rows(self, rom_id):
+        data = bytes(self.data)
+        for offset, text, n in self.records:
+            bank, address = self._bank_address(offset)
+            yield (rom_id, offset, bank, address, data[offset],
+                   data[offset + 1:offset + n], n, text)
+
+    #Yields a branches row for every instruction that transfers control
+    def _branch_rows(self, rom_id):
+        for offset, text, n in self.records:
+            if self.data[offset] in self.BRANCH_OPCODES:
+                kind, target_bank, target = self._branch_target(offset)
+                yield (rom_id, offset, offset // 0x4000, kind, target_bank,
+                       target)
+
+    #Yields a memory_refs row for every access to a fixed address
+    def _memory_rows(self, rom_id):
+        for offset, text, n in self.records:
+            if self.data[offset] in self.MEMORY_OPCODES:
+                access, target = self._memory_target(offset)
+                yield rom_id, offset, offset // 0x4000, access, target
+
+    #Appends the header, hashes, instructions and cross-references to
+    #a SQLite database.  Each ROM is written in a single transaction and
+    #replaces any earlier export of the same ROM, so several processes
+    #may export into the same database at once.
+    def export_sqlite(self, db_path, rom_path=None):
+        self._decoded()
+
+        db = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("BEGIN IMMEDIATE")
+            self._create_sqlite_schema(db)
+            db.execute("COMMIT")
+
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                old = db.execute("SELECT id FROM roms WHERE md5 = ?",
+                                 (self.hash,)).fetchone()
+                if old is not None:
+                    for table in ("instructions", "branches", "memory_refs"):
+                        db.execute("DELETE FROM " + table
+                                   + " WHERE rom_id = ?", old)
+                    db.execute("DELETE FROM roms WHERE id = ?", old)
+
+                columns = ["md5", "sha1", "path", "size"]
+                columns += list(self.header.keys())
+                values = [self.hash, self.sha1, rom_path, len(self.data)]
+                values += [self._sqlite_value(v) for v in self.header.values()]
+                rom_id = db.execute(
+                    "INSERT INTO roms (" + ", ".join(columns) + ") VALUES ("
+                    + ", ".join("?" * len(columns)) + ")", values).lastrowid
+
+                self._sqlite_insert(db,
+                    "INSERT INTO instructions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._instruction_rows(rom_id))
+                self._sqlite_insert(db,
+                    "INSERT INTO branches VALUES (?, ?, ?, ?, ?, ?)",
+                    self._branch_rows(rom_id))
+                self._sqlite_insert(db,
+                    "INSERT INTO memory_refs VALUES (?, ?, ?, ?, ?)",
+                    self._memory_rows(rom_id))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        finally:
+            db.close()
     
-def main():
-    if len(argv) is 3:
-        input_file = open(argv[1], "rb")
-        output_file = open(argv[2], "w")
-        
-        rom = ROM(input_file.read())
-        rom.disassemble(output_file)
+#Class to look up RGBDS symbols by bank and address
+class SymbolTable:
+
+    #Ends of the regions of the address space, a symbol never covers
+    #addresses past the end of its region
+    REGION_ENDS = [0x4000, 0x8000, 0xA000, 0xC000, 0xE000, 0xFE00,
+                   0xFF00, 0xFF80, 0xFFFF, 0x10000]
+
+    #Initializes an empty SymbolTable
+    def __init__(self):
+        self.symbols = {}
+        self.sections = {}
+        self.ends = set()
+        self.keys = []
+        self.names = []
+
+    #Loads a .sym or .map file, chosen by its extension
+    def load(self, path):
+        if path.lower().endswith(".map"):
+            self.load_map(path)
+        else:
+            self.load_sym(path)
+
+    #Loads an RGBDS .sym file of "bank:address name" lines
+    def load_sym(self, path):
+        sym_file = open(path, "r")
+        for line in sym_file:
+            line = line.split(";", 1)[0].split()
+            if len(line) < 2 or ":" not in line[0]:
+                continue
+            bank, address = line[0].split(":", 1)
+            try:
+                key = (int(bank, 16) << 16) | int(address, 16)
+            except ValueError:
+                continue
+            self.symbols.setdefault(key, line[1])
+        sym_file.close()
+        self._sort()
+
+    #Loads the sections and symbols of an RGBDS .map file
+    def load_map(self, path):
+        map_file = open(path, "r")
+        bank = None
+        for line in map_file:
+            match = re.match(r"(\w+) bank #(\d+):", line)
+            if match is not None:
+                bank = int(match.group(2))
+                continue
+            if bank is None:
+                continue
+            match = re.match(r"\s*\$([0-9A-Fa-f]{4}) = (\S+)", line)
+            if match is not None:
+                key = (bank << 16) | int(match.group(1), 16)
+                self.symbols.setdefault(key, match.group(2))
+                continue
+            match = re.match(r'\s*SECTION: \$([0-9A-Fa-f]{4})'
+                             r'(?:-\$([0-9A-Fa-f]{4}))?.*\["(.*)"\]', line)
+            if match is not None:
+                key = (bank << 16) | int(match.group(1), 16)
+                self.sections.setdefault(key, match.group(3))
+                if match.group(2) is not None:
+                    self.ends.add((bank << 16) + int(match.group(2), 16) + 1)
+        map_file.close()
+        self._sort()
+
+    #Rebuilds the sorted keys and names.  Section names are not valid
+    #symbols, so the start and end of a section are only marked with no
+    #name, bounding the symbol before them, unless a symbol starts there.
+    def _sort(self):
+        merged = dict.fromkeys(self.ends)
+        merged.update(dict.fromkeys(self.sections))
+        merged.update(self.symbols)
+        self.keys = sorted(merged)
+        self.names = [merged[k] for k in self.keys]
+
+    #Returns (name, offset) for the symbol covering an address in a bank,
+    #or None
+    def lookup(self, bank, address):
+        i = bisect.bisect_right(self.keys, (bank << 16) | address) - 1
+        if i < 0:
+            return None
+        key = self.keys[i]
+        start = key & 0xFFFF
+        if key >> 16 != bank or self.names[i] is None or \
+                bisect.bisect_right(self.REGION_ENDS, start) != \
+                bisect.bisect_right(self.REGION_ENDS, address):
+            return None
+        return self.names[i], address - start
+
+    #Formats a (name, offset) pair as symbol+offset
+    def format(self, name, offset):
+        if offset == 0:
+            return name
+        return name + "+${:X}".format(offset)
+
+    #Returns an address in a bank as symbol+offset, or None
+    def resolve(self, bank, address):
+        symbol = self.lookup(bank, address)
+        if symbol is None:
+            return None
+        return self.format(*symbol)
+
+#Class to record which bytes of a ROM are code and which are data, from
+#an emulator's code/data log or execution trace
+class CodeDataLog:
+
+    #Flags of each byte in bitmap
+    CODE = 0x01
+    DATA = 0x02
+
+    #Keeps only the code and data flags of a CDL byte
+    FLAGS = bytes(b & 0x03 for b in range(256))
+
+    #Finds bytes flagged as code
+    CODE_PATTERN = re.compile(b"[\x01\x03]")
+
+    #Matches a bank:address token at the start of a trace line
+    TRACE_PATTERN = re.compile(rb"\s*([0-9A-Fa-f]{2}):([0-9A-Fa-f]{4})(?:\s|$)")
+
+    #Initializes an empty log for a ROM of size bytes
+    def __init__(self, size):
+        self.bitmap = bytearray(size)
+
+    #Loads a .cdl file, or an execution trace otherwise.  Either may be
+    #gzip compressed.  Returns the number of trace lines skipped because
+    #their bank is unknown.
+    def load(self, path):
+        lower = path.lower()
+        if lower.endswith(".gz"):
+            stream = gzip.open(path, "rb")
+            lower = lower[:-3]
+        else:
+            stream = open(path, "rb")
+        try:
+            if lower.endswith(".cdl"):
+                self.load_cdl(stream)
+                return 0
+            return self.load_trace(stream)
+        finally:
+            stream.close()
+
+    #Merges a code/data log of one flag byte per ROM byte, bit 0 set for
+    #code and bit 1 for data, optionally after a Mesen "CDLv2" header
+    def load_cdl(self, stream):
+        position = 0
+        chunk = stream.read(CHUNK_SIZE)
+        if chunk.startswith(b"CDLv2"):
+            chunk = chunk[9:]
+        while chunk and position < len(self.bitmap):
+            chunk = chunk[:len(self.bitmap) - position].translate(self.FLAGS)
+            end = position + len(chunk)
+            merged = int.from_bytes(self.bitmap[position:end], "little") | \
+                int.from_bytes(chunk, "little")
+            self.bitmap[position:end] = merged.to_bytes(len(chunk), "little")
+            position = end
+            chunk = stream.read(CHUNK_SIZE)
+
+    #Marks the start of every executed instruction in a text trace, one
+    #line per instruction containing PC:address, or else beginning with a
+    #bank:address token.  A PC line takes its bank from a bank:address
+    #token at its start with the same address.  Without a bank,
+    #$4000-$7FFF is bank 1 of a 32 KByte ROM, and unknown in a larger
+    #one, so those lines are skipped.  Returns the number skipped.
+    def load_trace(self, stream):
+        bitmap = self.bitmap
+        size = len(bitmap)
+        banked = size > 0x8000
+        skipped = 0
+        match = self.TRACE_PATTERN.match
+        for line in stream:
+            m = match(line)
+            i = line.find(b"PC:")
+            if i >= 0:
+                try:
+                    address = int(line[i + 3:i + 7], 16)
+                except ValueError:
+                    continue
+                bank = None
+                if m is not None and int(m.group(2), 16) == address:
+                    bank = int(m.group(1), 16)
+            elif m is not None:
+                bank = int(m.group(1), 16)
+                address = int(m.group(2), 16)
+            else:
+                continue
+            if address < 0x4000:
+                offset = address
+            elif address < 0x8000:
+                if bank is None:
+                    if banked:
+                        skipped += 1
+                        continue
+                    bank = 1
+                offset = max(bank, 1) * 0x4000 + address - 0x4000
+            else:
+                continue
+            if offset < size:
+                bitmap[offset] |= self.CODE
+        return skipped
+
+    #Returns the first offset at or after start flagged as code, or the
+    #size of the ROM if there is none
+    def next_code(self, start):
+        m = self.CODE_PATTERN.search(self.bitmap, start)
+        if m is None:
+            return len(self.bitmap)
+        return m.start()
+
+#Class for a minimal headless LR35902 interpreter, used to find the code
+#a ROM actually runs.  Memory is one flat bytearray with the current ROM
+#bank copied into $4000-$7FFF, and there is no video or audio, only
+#enough timing for LY, the timer and the VBlank interrupt.
+class CPU:
+
+    #Machine cycles per scanline, and scanlines per frame
+    LINE_CYCLES = 114
+    FRAME_LINES = 154
+
+    #Memory bank controller of each cartridge type, 0 for none
+    MBC_TYPES = dict([(t, 1) for t in range(0x01, 0x04)] +
+                     [(t, 3) for t in range(0x0F, 0x14)] +
+                     [(t, 5) for t in range(0x19, 0x1F)])
+
+    #M-cycles per timer tick for each TAC clock select
+    TIMER_PERIODS = (256, 4, 16, 64)
+
+    #Buttons held down, active low, for frames in each second: Start
+    #then A, so that title screens and menus are passed
+    START_FRAMES = range(0, 5)
+    A_FRAMES = range(30, 35)
+
+    #Initializes the CPU in the state the boot ROM leaves it in, marking
+    #executed instructions in code_map, a CodeDataLog
+    def __init__(self, rom, code_map):
+        self.rom = bytes(rom.data)
+        if len(self.rom) % 0x4000:
+            self.rom += bytes(0x4000 - len(self.rom) % 0x4000)
+        if len(self.rom) < 0x8000:
+            self.rom += bytes(0x8000 - len(self.rom))
+        self.banks = len(self.rom) // 0x4000
+        self.mbc = self.MBC_TYPES.get(rom.data[0x147], 0)
+        self.code_map = code_map
+
+        #Two spare bytes mirror $0000-$0001, so that an operand read past
+        #$FFFF wraps around
+        self.mem = bytearray(0x10002)
+        self.mem[0:0x8000] = self.rom[0:0x8000]
+        self.mem[0x10000:0x10002] = self.rom[0:2]
+        self.seen = bytearray(0x10002)
+        self.ram = bytearray(0x2000 * 16)
+
+        #Registers in the order opcodes encode them, B C D E H L F A.
+        #Slot 6 encodes [HL] in opcodes, so it holds F instead.
+        self.r = [0x00, 0x13, 0x00, 0xD8, 0x01, 0x4D, 0xB0, 0x01]
+        #Extra cycles of taken branches and CB opcodes, SP, IME, halted
+        self.s = [0, 0xFFFE, 0, 0]
+        self.pc = 0x100
+        self.stop_reason = None
+
+        self.bank = 1
+        self.ram_bank = 0
+        self.cycles = 0
+        self.next_line = self.LINE_CYCLES
+        self.frames = 0
+        self.timer = 0
+        self.buttons = 0x0F
+
+        self.mem[0xFF00] = 0xCF
+        self.mem[0xFF40] = 0x91
+        self.mem[0xFF47] = 0xFC
+
+        self.dispatch = self._build_dispatch()
+
+    #Memory bank controllers
+
+    #Handles a write to the ROM area
+    def _mbc_write(self, address, value):
+        if address < 0x2000 or self.mbc == 0:
+            return
+        if address < 0x4000:
+            if self.mbc == 1:
+                self._map_rom((self.bank & 0x60) | (value & 0x1F or 1))
+            elif self.mbc == 3:
+                self._map_rom(value & 0x7F or 1)
+            elif address < 0x3000:
+                self._map_rom((self.bank & 0x100) | value)
+            else:
+                self._map_rom((self.bank & 0xFF) | (value & 0x01) << 8)
+        elif address < 0x6000:
+            if self.mbc == 1:
+                self._map_rom((self.bank & 0x1F) | (value & 0x03) << 5)
+            elif self.mbc == 3:
+                if value < 4:
+                    self._map_ram(value)
+            else:
+                self._map_ram(value & 0x0F)
+
+    #Copies a ROM bank into $4000-$7FFF
+    def _map_rom(self, bank):
+        bank %= self.banks
+        if bank == self.bank:
+            return
+        self._flush_bank()
+        self.bank = bank
+        self.mem[0x4000:0x8000] = self.rom[bank * 0x4000:(bank + 1) * 0x4000]
+
+    #Swaps a cartridge RAM bank into $A000-$BFFF
+    def _map_ram(self, bank):
+        if bank == self.ram_bank:
+            return
+        old = self.ram_bank * 0x2000
+        self.ram[old:old + 0x2000] = self.mem[0xA000:0xC000]
+        self.mem[0xA000:0xC000] = self.ram[bank * 0x2000:(bank + 1) * 0x2000]
+        self.ram_bank = bank
+
+    #Execution recording
+
+    #ORs the executed flags for a CPU address range into code_map
+    def _merge(self, offset, start, end):
+        bitmap = self.code_map.bitmap
+        end = min(end, start + len(bitmap) - offset)
+        if end <= start:
+            return
+        seen = self.seen[start:end]
+        merged = int.from_bytes(bitmap[offset:offset + end - start], "little") \
+            | int.from_bytes(seen, "little")
+        bitmap[offset:offset + end - start] = merged.to_bytes(end - start,
+                                                              "little")
+        self.seen[start:end] = bytes(end - start)
+
+    #Records the code executed in the current ROM bank
+    def _flush_bank(self):
+        self._merge(self.bank * 0x4000, 0x4000, 0x8000)
+
+    #Records all code executed so far
+    def flush(self):
+        self._merge(0, 0, 0x4000)
+        self._flush_bank()
 
-        input_file.close()
-        output_file.close()
+    #Timing
+
+    #Recomputes the joypad register from its select bits
+    def _joypad(self):
+        select = self.mem[0xFF00] & 0x30
+        low = 0x0F
+        if not select & 0x20:
+            low &= self.buttons
+        self.mem[0xFF00] = 0xC0 | select | low
+
+    #Advances LY, DIV and the timer by one scanline
+    def _scanline(self, cycles):
+        mem = self.mem
+        ly = mem[0xFF44] + 1
+        if ly == self.FRAME_LINES:
+            ly = 0
+            self.frames += 1
+            second = self.frames % 60
+            if second in self.START_FRAMES:
+                self.buttons = 0x07
+            elif second in self.A_FRAMES:
+                self.buttons = 0x0E
+            else:
+                self.buttons = 0x0F
+            self._joypad()
+        mem[0xFF44] = ly
+        if ly == 144:
+            mem[0xFF0F] |= 0x01
+
+        stat = mem[0xFF41] & 0xF8
+        if ly >= 144:
+            stat |= 0x01
+        if ly == mem[0xFF45]:
+            stat |= 0x04
+            if stat & 0x40:
+                mem[0xFF0F] |= 0x02
+        mem[0xFF41] = stat
+
+        mem[0xFF04] = (cycles >> 6) & 0xFF
+        tac = mem[0xFF07]
+        if tac & 0x04:
+            period = self.TIMER_PERIODS[tac & 0x03]
+            self.timer += self.LINE_CYCLES
+            tima = mem[0xFF05] + self.timer // period
+            self.timer %= period
+            while tima > 0xFF:
+                tima += mem[0xFF06] - 0x100
+                mem[0xFF0F] |= 0x04
+            mem[0xFF05] = tima
+
+    #Services the highest priority pending interrupt, returning the new PC
+    def _interrupt(self, pc):
+        s = self.s
+        pending = self.mem[0xFFFF] & self.mem[0xFF0F] & 0x1F
+        if not pending or not s[2]:
+            return pc
+        bit = 0
+        while not pending & (1 << bit):
+            bit += 1
+        self.mem[0xFF0F] &= ~(1 << bit) & 0xFF
+        s[2] = 0
+        if s[3]:
+            s[3] = 0
+            pc += 1
+        sp = (s[1] - 2) & 0xFFFF
+        s[1] = sp
+        self.write((sp + 1) & 0xFFFF, pc >> 8)
+        self.write(sp, pc & 0xFF)
+        s[0] += 5
+        return 0x40 + 8 * bit
+
+    #Runs for at most instructions instructions and frames frames, and
+    #records every executed address in code_map.  Returns the number of
+    #instructions executed.  An invalid opcode stops the run early, with
+    #its description in stop_reason and its address in pc.
+    def run(self, instructions=None, frames=None):
+        limit = sys.maxsize if instructions is None else instructions
+        frame_limit = sys.maxsize if frames is None else self.frames + frames
+        line = self.LINE_CYCLES
+
+        #halt skips to the next scanline rather than spinning
+        cycles = list(ROM.CYCLES_NOT_TAKEN)
+        cycles[0x76] = line
+
+        dispatch = self.dispatch
+        mem = self.mem
+        seen = self.seen
+        s = self.s
+        pc = self.pc
+        cyc = self.cycles
+        next_line = self.next_line
+
+        self.stop_reason = None
+        count = 0
+        try:
+            for count in range(1, limit + 1):
+                op = mem[pc]
+                seen[pc] = 1
+                pc = dispatch[op](pc + 1) & 0xFFFF
+                cyc += cycles[op]
+                if cyc >= next_line:
+                    cyc += s[0]
+                    s[0] = 0
+                    while cyc >= next_line:
+                        next_line += line
+                        self._scanline(cyc)
+                    pc = self._interrupt(pc)
+                    if self.frames >= frame_limit:
+                        break
+        except ValueError as e:
+            seen[pc] = 0
+            self.stop_reason = str(e)
+            count -= 1
+
+        self.pc = pc
+        self.cycles = cyc + s[0]
+        s[0] = 0
+        self.next_line = next_line
+        self.flush()
+        return count
+
+    #Dispatch tables
+
+    #Builds the handler of every opcode.  Each takes the address after
+    #the opcode and returns the address of the next instruction.
+    def _build_dispatch(self):
+        r = self.r
+        s = self.s
+        mem = self.mem
+        mbc_write = self._mbc_write
+        joypad = self._joypad
+        taken = ROM.CYCLES
+        not_taken = ROM.CYCLES_NOT_TAKEN
+        cb_cycles = ROM.CB_CYCLES
+
+        def write(address, value):
+            if address >= 0xFF00:
+                if address == 0xFF46:
+                    source = value << 8
+                    mem[0xFE00:0xFEA0] = mem[source:source + 0xA0]
+                elif address == 0xFF00:
+                    mem[0xFF00] = value & 0x30
+                    joypad()
+                    return
+                elif address == 0xFF04:
+                    value = 0
+                elif address == 0xFF44:
+                    return
+                mem[address] = value
+            elif address >= 0x8000:
+                mem[address] = value
+            else:
+                mbc_write(address, value)
+        self.write = write
+
+        def push(value):
+            sp = (s[1] - 2) & 0xFFFF
+            s[1] = sp
+            write((sp + 1) & 0xFFFF, value >> 8)
+            write(sp, value & 0xFF)
+
+        def pop():
+            sp = s[1]
+            s[1] = (sp + 2) & 0xFFFF
+            return mem[sp] | mem[(sp + 1) & 0xFFFF] << 8
+
+        #8-bit arithmetic, updating A and F
+
+        def add(v):
+            a = r[7]
+            t = a + v
+            r[6] = (not t & 0xFF) << 7 | ((a & 0xF) + (v & 0xF) > 0xF) << 5 \
+                | (t > 0xFF) << 4
+            r[7] = t & 0xFF
+
+        def adc(v):
+            a = r[7]
+            c = (r[6] >> 4) & 1
+            t = a + v + c
+            r[6] = (not t & 0xFF) << 7 \
+                | ((a & 0xF) + (v & 0xF) + c > 0xF) << 5 | (t > 0xFF) << 4
+            r[7] = t & 0xFF
+
+        def sub(v):
+            a = r[7]
+            t = a - v
+            r[6] = (not t & 0xFF) << 7 | 0x40 | ((a & 0xF) < (v & 0xF)) << 5 \
+                | (t < 0) << 4
+            r[7] = t & 0xFF
+
+        def sbc(v):
+            a = r[7]
+            c = (r[6] >> 4) & 1
+            t = a - v - c
+            r[6] = (not t & 0xFF) << 7 | 0x40 \
+                | ((a & 0xF) - (v & 0xF) - c < 0) << 5 | (t < 0) << 4
+            r[7] = t & 0xFF
+
+        def and_(v):
+            a = r[7] & v
+            r[7] = a
+            r[6] = (not a) << 7 | 0x20
+
+        def xor(v):
+            a = r[7] ^ v
+            r[7] = a
+            r[6] = (not a) << 7
+
+        def or_(v):
+            a = r[7] | v
+            r[7] = a
+            r[6] = (not a) << 7
+
+        def cp(v):
+            a = r[7]
+            t = a - v
+            r[6] = (not t & 0xFF) << 7 | 0x40 | ((a & 0xF) < (v & 0xF)) << 5 \
+                | (t < 0) << 4
+
+        alu = (add, adc, sub, sbc, and_, xor, or_, cp)
+
+        def inc(v):
+            t = (v + 1) & 0xFF
+            r[6] = (r[6] & 0x10) | (not t) << 7 | ((v & 0xF) == 0xF) << 5
+            return t
+
+        def dec(v):
+            t = (v - 1) & 0xFF
+            r[6] = (r[6] & 0x10) | (not t) << 7 | 0x40 | (not v & 0xF) << 5
+            return t
+
+        #CB prefixed shifts and rotates, returning the result and updating F
+
+        def rlc(v):
+            c = v >> 7
+            t = ((v << 1) | c) & 0xFF
+            r[6] = (not t) << 7 | c << 4
+            return t
+
+        def rrc(v):
+            c = v & 1
+            t = (v >> 1) | c << 7
+            r[6] = (not t) << 7 | c << 4
+            return t
+
+        def rl(v):
+            t = ((v << 1) | (r[6] >> 4) & 1) & 0xFF
+            r[6] = (not t) << 7 | (v >> 7) << 4
+            return t
+
+        def rr(v):
+            t = (v >> 1) | ((r[6] >> 4) & 1) << 7
+            r[6] = (not t) << 7 | (v & 1) << 4
+            return t
+
+        def sla(v):
+            t = (v << 1) & 0xFF
+            r[6] = (not t) << 7 | (v >> 7) << 4
+            return t
+
+        def sra(v):
+            t = (v >> 1) | (v & 0x80)
+            r[6] = (not t) << 7 | (v & 1) << 4
+            return t
+
+        def swap(v):
+            t = ((v & 0xF) << 4) | v >> 4
+            r[6] = (not t) << 7
+            return t
+
+        def srl(v):
+            t = v >> 1
+            r[6] = (not t) << 7 | (v & 1) << 4
+            return t
+
+        shifts = (rlc, rrc, rl, rr, sla, sra, swap, srl)
+
+        #Conditions of jr, jp, call and ret as (flag mask, wanted value)
+        conditions = ((0x80, 0), (0x80, 0x80), (0x10, 0), (0x10, 0x10))
+
+        #Register pairs as (high, low) indices into r, AF for push and pop
+        pairs = ((0, 1), (2, 3), (4, 5))
+        stack_pairs = ((0, 1), (2, 3), (4, 5), (7, 6))
+
+        dispatch = [None] * 256
+        cb_dispatch = [None] * 256
+
+        def invalid(pc):
+            raise ValueError("invalid opcode ${:02X} at ${:04X}".format(
+                mem[pc - 1], pc - 1))
+
+        for op in range(256):
+            dispatch[op] = invalid
+
+        dispatch[0x00] = lambda pc: pc
+        dispatch[0x10] = lambda pc: pc + 1
+
+        #ld r, r' and halt
+        for op in range(0x40, 0x80):
+            dst = (op >> 3) & 7
+            src = op & 7
+            if op == 0x76:
+                def h(pc):
+                    if mem[0xFFFF] & mem[0xFF0F] & 0x1F:
+                        s[3] = 0
+                        return pc
+                    s[3] = 1
+                    return pc - 1
+            elif src == 6:
+                def h(pc, dst=dst):
+                    r[dst] = mem[(r[4] << 8) | r[5]]
+                    return pc
+            elif dst == 6:
+                def h(pc, src=src):
+                    write((r[4] << 8) | r[5], r[src])
+                    return pc
+            else:
+                def h(pc, dst=dst, src=src):
+                    r[dst] = r[src]
+                    return pc
+            dispatch[op] = h
+
+        #ALU A, r and ALU A, d8
+        for op in range(0x80, 0xC0):
+            f = alu[(op >> 3) & 7]
+            src = op & 7
+            if src == 6:
+                def h(pc, f=f):
+                    f(mem[(r[4] << 8) | r[5]])
+                    return pc
+            else:
+                def h(pc, f=f, src=src):
+                    f(r[src])
+                    return pc
+            dispatch[op] = h
+        for op in range(0xC6, 0x100, 8):
+            def h(pc, f=alu[(op >> 3) & 7]):
+                f(mem[pc])
+                return pc + 1
+            dispatch[op] = h
+
+        #inc r, dec r and ld r, d8
+        for reg in range(8):
+            if reg == 6:
+                def h_inc(pc):
+                    hl = (r[4] << 8) | r[5]
+                    write(hl, inc(mem[hl]))
+                    return pc
+                def h_dec(pc):
+                    hl = (r[4] << 8) | r[5]
+                    write(hl, dec(mem[hl]))
+                    return pc
+                def h_ld(pc):
+                    write((r[4] << 8) | r[5], mem[pc])
+                    return pc + 1
+            else:
+                def h_inc(pc, reg=reg):
+                    r[reg] = inc(r[reg])
+                    return pc
+                def h_dec(pc, reg=reg):
+                    r[reg] = dec(r[reg])
+                    return pc
+                def h_ld(pc, reg=reg):
+                    r[reg] = mem[pc]
+                    return pc + 1
+            dispatch[0x04 | reg << 3] = h_inc
+            dispatch[0x05 | reg << 3] = h_dec
+            dispatch[0x06 | reg << 3] = h_ld
+
+        #16-bit loads, inc, dec and add HL
+        for p, (hi, lo) in enumerate(pairs):
+            def h(pc, hi=hi, lo=lo):
+                r[lo] = mem[pc]
+                r[hi] = mem[pc + 1]
+                return pc + 2
+            dispatch[0x01 | p << 4] = h
+            def h(pc, hi=hi, lo=lo):
+                v = (((r[hi] << 8) | r[lo]) + 1) & 0xFFFF
+                r[hi] = v >> 8
+                r[lo] = v & 0xFF
+                return pc
+            dispatch[0x03 | p << 4] = h
+            def h(pc, hi=hi, lo=lo):
+                v = (((r[hi] << 8) | r[lo]) - 1) & 0xFFFF
+                r[hi] = v >> 8
+                r[lo] = v & 0xFF
+                return pc
+            dispatch[0x0B | p << 4] = h
+        def ld_sp(pc):
+            s[1] = mem[pc] | mem[pc + 1] << 8
+            return pc + 2
+        def inc_sp(pc):
+            s[1] = (s[1] + 1) & 0xFFFF
+            return pc
+        def dec_sp(pc):
+            s[1] = (s[1] - 1) & 0xFFFF
+            return pc
+        dispatch[0x31] = ld_sp
+        dispatch[0x33] = inc_sp
+        dispatch[0x3B] = dec_sp
+
+        def add_hl(v):
+            hl = (r[4] << 8) | r[5]
+            t = hl + v
+            r[6] = (r[6] & 0x80) | ((hl & 0xFFF) + (v & 0xFFF) > 0xFFF) << 5 \
+                | (t > 0xFFFF) << 4
+            r[4] = (t >> 8) & 0xFF
+            r[5] = t & 0xFF
+        for p, (hi, lo) in enumerate(pairs):
+            def h(pc, hi=hi, lo=lo):
+                add_hl((r[hi] << 8) | r[lo])
+                return pc
+            dispatch[0x09 | p << 4] = h
+        def h(pc):
+            add_hl(s[1])
+            return pc
+        dispatch[0x39] = h
+
+        #Loads through BC, DE and HL+/HL-
+        def h(pc):
+            write((r[0] << 8) | r[1], r[7])
+            return pc
+        dispatch[0x02] = h
+        def h(pc):
+            write((r[2] << 8) | r[3], r[7])
+            return pc
+        dispatch[0x12] = h
+        def h(pc):
+            r[7] = mem[(r[0] << 8) | r[1]]
+            return pc
+        dispatch[0x0A] = h
+        def h(pc):
+            r[7] = mem[(r[2] << 8) | r[3]]
+            return pc
+        dispatch[0x1A] = h
+        for op, step in ((0x22, 1), (0x32, -1)):
+            def h(pc, step=step):
+                hl = (r[4] << 8) | r[5]
+                write(hl, r[7])
+                hl = (hl + step) & 0xFFFF
+                r[4] = hl >> 8
+                r[5] = hl & 0xFF
+                return pc
+            dispatch[op] = h
+        for op, step in ((0x2A, 1), (0x3A, -1)):
+            def h(pc, step=step):
+                hl = (r[4] << 8) | r[5]
+                r[7] = mem[hl]
+                hl = (hl + step) & 0xFFFF
+                r[4] = hl >> 8
+                r[5] = hl & 0xFF
+                return pc
+            dispatch[op] = h
+
+        #Rotates of A, which always clear Z
+        def h(pc):
+            a = r[7]
+            r[7] = ((a << 1) | a >> 7) & 0xFF
+            r[6] = (a >> 7) << 4
+            return pc
+        dispatch[0x07] = h
+        def h(pc):
+            a = r[7]
+            r[7] = (a >> 1) | (a & 1) << 7
+            r[6] = (a & 1) << 4
+            return pc
+        dispatch[0x0F] = h
+        def h(pc):
+            a = r[7]
+            r[7] = ((a << 1) | (r[6] >> 4) & 1) & 0xFF
+            r[6] = (a >> 7) << 4
+            return pc
+        dispatch[0x17] = h
+        def h(pc):
+            a = r[7]
+            r[7] = (a >> 1) | ((r[6] >> 4) & 1) << 7
+            r[6] = (a & 1) << 4
+            return pc
+        dispatch[0x1F] = h
+
+        #daa, cpl, scf and ccf
+        def h(pc):
+            a = r[7]
+            f = r[6]
+            c = f & 0x10
+            if not f & 0x40:
+                if c or a > 0x99:
+                    a += 0x60
+                    c = 0x10
+                if f & 0x20 or (a & 0xF) > 9:
+                    a += 0x06
+            else:
+                if c:
+                    a -= 0x60
+                if f & 0x20:
+                    a -= 0x06
+            a &= 0xFF
+            r[7] = a
+            r[6] = (not a) << 7 | (f & 0x40) | c
+            return pc
+        dispatch[0x27] = h
+        def h(pc):
+            r[7] ^= 0xFF
+            r[6] |= 0x60
+            return pc
+        dispatch[0x2F] = h
+        def h(pc):
+            r[6] = (r[6] & 0x80) | 0x10
+            return pc
+        dispatch[0x37] = h
+        def h(pc):
+            r[6] = (r[6] & 0x80) | (r[6] & 0x10) ^ 0x10
+            return pc
+        dispatch[0x3F] = h
+
+        #ld [a16], SP
+        def h(pc):
+            address = mem[pc] | mem[pc + 1] << 8
+            write(address, s[1] & 0xFF)
+            write((address + 1) & 0xFFFF, s[1] >> 8)
+            return pc + 2
+        dispatch[0x08] = h
+
+        #Jumps, calls, returns and rst
+        def h(pc):
+            e = mem[pc]
+            return (pc + 1 + e - ((e & 0x80) << 1)) & 0xFFFF
+        dispatch[0x18] = h
+        dispatch[0xC3] = lambda pc: mem[pc] | mem[pc + 1] << 8
+        dispatch[0xE9] = lambda pc: (r[4] << 8) | r[5]
+        def h(pc):
+            push(pc + 2)
+            return mem[pc] | mem[pc + 1] << 8
+        dispatch[0xCD] = h
+        dispatch[0xC9] = lambda pc: pop()
+        def h(pc):
+            s[2] = 1
+            return pop()
+        dispatch[0xD9] = h
+        for op in range(0xC7, 0x100, 8):
+            def h(pc, target=op & 0x38):
+                push(pc)
+                return target
+            dispatch[op] = h
+
+        for cc, (mask, want) in enumerate(conditions):
+            op = 0x20 | cc << 3
+            def h(pc, mask=mask, want=want, extra=taken[op] - not_taken[op]):
+                if r[6] & mask == want:
+                    s[0] += extra
+                    e = mem[pc]
+                    return (pc + 1 + e - ((e & 0x80) << 1)) & 0xFFFF
+                return pc + 1
+            dispatch[op] = h
+            op = 0xC2 | cc << 3
+            def h(pc, mask=mask, want=want, extra=taken[op] - not_taken[op]):
+                if r[6] & mask == want:
+                    s[0] += extra
+                    return mem[pc] | mem[pc + 1] << 8
+                return pc + 2
+            dispatch[op] = h
+            op = 0xC4 | cc << 3
+            def h(pc, mask=mask, want=want, extra=taken[op] - not_taken[op]):
+                if r[6] & mask == want:
+                    s[0] += extra
+                    push(pc + 2)
+                    return mem[pc] | mem[pc + 1] << 8
+                return pc + 2
+            dispatch[op] = h
+            op = 0xC0 | cc << 3
+            def h(pc, mask=mask, want=want, extra=taken[op] - not_taken[op]):
+                if r[6] & mask == want:
+                    s[0] += extra
+                    return pop()
+                return pc
+            dispatch[op] = h
+
+        #push and pop
+        for p, (hi, lo) in enumerate(stack_pairs):
+            def h(pc, hi=hi, lo=lo):
+                push((r[hi] << 8) | r[lo])
+                return pc
+            dispatch[0xC5 | p << 4] = h
+            def h(pc, hi=hi, lo=lo):
+                v = pop()
+                r[hi] = v >> 8
+                r[lo] = v & 0xFF
+                return pc
+            dispatch[0xC1 | p << 4] = h
+        def h(pc):
+            v = pop()
+            r[7] = v >> 8
+            r[6] = v & 0xF0
+            return pc
+        dispatch[0xF1] = h
+
+        #High memory and absolute loads
+        def h(pc):
+            write(0xFF00 | mem[pc], r[7])
+            return pc + 1
+        dispatch[0xE0] = h
+        def h(pc):
+            r[7] = mem[0xFF00 | mem[pc]]
+            return pc + 1
+        dispatch[0xF0] = h
+        def h(pc):
+            write(0xFF00 | r[1], r[7])
+            return pc
+        dispatch[0xE2] = h
+        def h(pc):
+            r[7] = mem[0xFF00 | r[1]]
+            return pc
+        dispatch[0xF2] = h
+        def h(pc):
+            write(mem[pc] | mem[pc + 1] << 8, r[7])
+            return pc + 2
+        dispatch[0xEA] = h
+        def h(pc):
+            r[7] = mem[mem[pc] | mem[pc + 1] << 8]
+            return pc + 2
+        dispatch[0xFA] = h
+
+        #Stack pointer arithmetic
+        def sp_offset(e):
+            sp = s[1]
+            r[6] = ((sp & 0xF) + (e & 0xF) > 0xF) << 5 \
+                | ((sp & 0xFF) + e > 0xFF) << 4
+            return (sp + e - ((e & 0x80) << 1)) & 0xFFFF
+        def h(pc):
+            s[1] = sp_offset(mem[pc])
+            return pc + 1
+        dispatch[0xE8] = h
+        def h(pc):
+            v = sp_offset(mem[pc])
+            r[4] = v >> 8
+            r[5] = v & 0xFF
+            return pc + 1
+        dispatch[0xF8] = h
+        def h(pc):
+            s[1] = (r[4] << 8) | r[5]
+            return pc
+        dispatch[0xF9] = h
+
+        #di and ei
+        def h(pc):
+            s[2] = 0
+            return pc
+        dispatch[0xF3] = h
+        def h(pc):
+            s[2] = 1
+            return pc
+        dispatch[0xFB] = h
+
+        #CB prefixed opcodes
+        for op in range(256):
+            reg = op & 7
+            kind = op >> 3
+            if kind < 8:
+                f = shifts[kind]
+                if reg == 6:
+                    def h(pc, f=f):
+                        hl = (r[4] << 8) | r[5]
+                        write(hl, f(mem[hl]))
+                        return pc
+                else:
+                    def h(pc, f=f, reg=reg):
+                        r[reg] = f(r[reg])
+                        return pc
+            elif kind < 16:
+                bit = 1 << (kind - 8)
+                if reg == 6:
+                    def h(pc, bit=bit):
+                        r[6] = (r[6] & 0x10) | 0x20 \
+                            | (not mem[(r[4] << 8) | r[5]] & bit) << 7
+                        return pc
+                else:
+                    def h(pc, bit=bit, reg=reg):
+                        r[6] = (r[6] & 0x10) | 0x20 | (not r[reg] & bit) << 7
+                        return pc
+            else:
+                if kind < 24:
+                    mask = ~(1 << (kind - 16)) & 0xFF
+                    value = 0
+                else:
+                    mask = 0xFF
+                    value = 1 << (kind - 24)
+                if reg == 6:
+                    def h(pc, mask=mask, value=value):
+                        hl = (r[4] << 8) | r[5]
+                        write(hl, (mem[hl] & mask) | value)
+                        return pc
+                else:
+                    def h(pc, mask=mask, value=value, reg=reg):
+                        r[reg] = (r[reg] & mask) | value
+                        return pc
+            cb_dispatch[op] = h
+        def h(pc):
+            op = mem[pc]
+            s[0] += cb_cycles[op]
+            return cb_dispatch[op](pc + 1)
+        dispatch[0xCB] = h
+
+        return dispatch
+
+#ROM input
+
+#File extensions of ROMs inside archives
+ROM_EXTENSIONS = (".gb", ".gbc", ".sgb")
+
+#Size of the reads used while decompressing
+CHUNK_SIZE = 1 << 16
+
+#Reads a ROM from a binary stream, hashing each chunk as it is
+#decompressed.  When size is known the chunks are read straight into
+#the ROM buffer.  Returns (data, (md5, sha1)).
+def read_rom(stream, size=None):
+    md5 = hashlib.md5()
+    sha1 = hashlib.sha1()
+
+    if size is None:
+        data = bytearray()
+        chunk = stream.read(CHUNK_SIZE)
+        while chunk:
+            md5.update(chunk)
+            sha1.update(chunk)
+            data += chunk
+            chunk = stream.read(CHUNK_SIZE)
+    else:
+        data = bytearray(size)
+        view = memoryview(data)
+        position = 0
+        while position < size:
+            chunk = view[position:position + CHUNK_SIZE]
+            n = stream.readinto(chunk)
+            if not n:
+                raise ValueError("ROM ended after " + str(position)
+                                 + " of " + str(size) + " bytes")
+            md5.update(chunk[:n])
+            sha1.update(chunk[:n])
+            position += n
+
+    return data, (md5.hexdigest(), sha1.hexdigest())
+
+#Class py7zr decompresses a .7z member into, hashing each chunk as it is
+#written into the ROM buffer
+class _HashingWriter(Py7zIO):
+
+    #Initializes an empty buffer
+    def __init__(self):
+        self.data = bytearray()
+        self.md5 = hashlib.md5()
+        self.sha1 = hashlib.sha1()
+        self.position = 0
+
+    def write(self, s):
+        self.md5.update(s)
+        self.sha1.update(s)
+        self.data += s
+        self.position = len(self.data)
+        return len(s)
+
+    def read(self, size=None):
+        end = len(self.data) if size is None else self.position + size
+        chunk = bytes(self.data[self.position:end])
+        self.position += len(chunk)
+        return chunk
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.position
+        elif whence == 2:
+            offset += len(self.data)
+        self.position = offset
+        return offset
+
+    def flush(self):
+        pass
+
+    def size(self):
+        return len(self.data)
+
+    #Returns (data, (md5, sha1)), like read_rom
+    def rom(self):
+        return self.data, (self.md5.hexdigest(), self.sha1.hexdigest())
+
+#Class that hands py7zr a _HashingWriter for each member it extracts
+class _HashingWriterFactory(WriterFactory):
+
+    #Initializes the factory with no writers
+    def __init__(self):
+        self.writers = {}
+
+    def create(self, filename):
+        writer = _HashingWriter()
+        self.writers[filename] = writer
+        return writer
+
+#Picks the archive members to read.  With no requested members, every
+#member with a ROM extension is read, or the only member if there is
+#just one.
+def _select_members(path, names, members):
+    if members:
+        missing = [m for m in members if m not in names]
+        if missing:
+            raise ValueError(path + " has no member named " + missing[0])
+        return [n for n in names if n in members]
+
+    roms = [n for n in names if n.lower().endswith(ROM_EXTENSIONS)]
+    if not roms and len(names) == 1:
+        roms = names
+    if not roms:
+        raise ValueError(path + " has no ROM members")
+    return roms
+
+#Yields (name, data, hashes) for every ROM in path.  Plain files,
+#.zip, .gz and (with py7zr installed) .7z archives are accepted, and
+#archive members are decompressed in memory one at a time, except that
+#the members of a .7z are all decompressed at once.
+def open_roms(path, members=None):
+    lower = path.lower()
+
+    if lower.endswith(".zip"):
+        archive = zipfile.ZipFile(path)
+        try:
+            infos = {i.filename : i for i in archive.infolist()
+                     if not i.is_dir()}
+            for name in _select_members(path, list(infos), members):
+                stream = archive.open(infos[name])
+                try:
+                    data, hashes = read_rom(stream, infos[name].file_size)
+                finally:
+                    stream.close()
+                yield name, data, hashes
+        finally:
+            archive.close()
+
+    elif lower.endswith(".gz"):
+        name = os.path.basename(path)[:-3]
+        _select_members(path, [name], members)
+        stream = gzip.open(path, "rb")
+        try:
+            data, hashes = read_rom(stream)
+        finally:
+            stream.close()
+        yield name, data, hashes
+
+    elif lower.endswith(".7z"):
+        if py7zr is None:
+            raise ValueError("py7zr is required to read " + path)
+        archive = py7zr.SevenZipFile(path, "r")
+        try:
+            names = [i.filename for i in archive.list() if not i.is_directory]
+            #Solid blocks are decompressed from their start, so every
+            #member is extracted in a single pass
+            selected = _select_members(path, names, members)
+            factory = _HashingWriterFactory()
+            archive.extract(targets=selected, factory=factory)
+            for name in selected:
+                data, hashes = factory.writers.pop(name).rom()
+                yield name, data, hashes
+        finally:
+            archive.close()
 
     else:
-        print("Usage: " + argv[0] + " rom_file output_file")
+        if members:
+            raise ValueError(path + " is not an archive")
+        stream = open(path, "rb")
+        try:
+            data, hashes = read_rom(stream)
+        finally:
+            stream.close()
+        yield None, data, hashes
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="A not so fully featured disassembler for the "
+                    "Nintendo Gameboy")
+    parser.add_argument("rom_file",
+                        help="a ROM, or a .zip, .gz or .7z archive of ROMs")
+    parser.add_argument("output_file", nargs="?")
+    parser.add_argument("--member", action="append", metavar="NAME",
+                        help="only read this archive member, may be "
+                             "given more than once")
+    parser.add_argument("--symbols", action="append", metavar="FILE",
+                        help="name addresses with an RGBDS .sym or .map "
+                             "file, may be given more than once")
+    parser.add_argument("--log", action="append", metavar="FILE",
+                        help="only disassemble the code in an emulator's "
+                             ".cdl code/data log or execution trace, may be "
+                             "given more than once")
+    parser.add_argument("--run", type=int, metavar="INSTRUCTIONS",
+                        help="run the ROM from $0100 for this many "
+                             "instructions and only disassemble the code "
+                             "it executes")
+    parser.add_argument("--frames", type=int, metavar="FRAMES",
+                        help="like --run, but stop after this many frames")
+    parser.add_argument("--cycles", action="store_true",
+                        help="annotate each line with its machine cycles")
+    parser.add_argument("--timing", metavar="REPORT",
+                        help="write per-routine and per-block cycle "
+                             "totals to a file")
+    parser.add_argument("--sqlite", metavar="DATABASE",
+                        help="append the header, instructions and "
+                             "cross-references to a SQLite database")
+    args = parser.parse_args()
+
+    if args.output_file is None and args.sqlite is None and \
+            args.timing is None:
+        parser.error("an output_file, --timing REPORT or --sqlite DATABASE "
+                     "is required")
+
+    symbols = None
+    if args.symbols:
+        symbols = SymbolTable()
+        try:
+            for path in args.symbols:
+                symbols.load(path)
+        except OSError as e:
+            parser.error(str(e))
+
+    #Outputs are only created once the first ROM has been read
+    output_file = None
+    timing_file = None
+    roms = open_roms(args.rom_file, args.member)
+
+    try:
+        while True:
+            try:
+                name, data, hashes = next(roms)
+            except StopIteration:
+                break
+            except (ValueError, OSError, zipfile.BadZipFile) as e:
+                parser.error(str(e))
+
+            rom = ROM(data, hashes)
+            if args.log or args.run is not None or args.frames is not None:
+                rom.code_map = CodeDataLog(len(data))
+            if args.log:
+                try:
+                    for path in args.log:
+                        skipped = rom.code_map.load(path)
+                        if skipped:
+                            sys.stderr.write(
+                                "gbdump: skipped " + str(skipped)
+                                + " lines of " + path + " in $4000-$7FFF "
+                                "with no ROM bank\n")
+                except OSError as e:
+                    parser.error(str(e))
+            if args.run is not None or args.frames is not None:
+                cpu = CPU(rom, rom.code_map)
+                count = cpu.run(args.run, args.frames)
+                if cpu.stop_reason is not None:
+                    sys.stderr.write(
+                        "gbdump: interpreter stopped after " + str(count)
+                        + " instructions: " + cpu.stop_reason + "\n")
+            rom_path = args.rom_file
+            if name is not None:
+                rom_path += ":" + name
+
+            if args.output_file is not None and output_file is None:
+                output_file = open(args.output_file, "w")
+            if args.timing is not None and timing_file is None:
+                timing_file = open(args.timing, "w")
+            #Keep the listing's decode pass for the timing report and
+            #export, which otherwise decode the ROM themselves
+            rom.symbols = symbols
+            if output_file is not None and \
+                    (timing_file is not None or args.sqlite is not None):
+                rom.records = []
+
+            if output_file is not None:
+                if name is not None:
+                    output_file.write("; Archive member " + name + "\n")
+                rom.disassemble(output_file, args.cycles, symbols)
+
+            if timing_file is not None:
+                if name is not None:
+                    timing_file.write("; Archive member " + name + "\n")
+                rom.timing_report(timing_file)
+
+            if args.sqlite is not None:
+                rom.export_sqlite(args.sqlite, rom_path)
+    finally:
+        if output_file is not None:
+            output_file.close()
+        if timing_file is not None:
+            timing_file.close()
 
   
 if __name__== "__main__":
@@ -0,0 +1,69 @@
+import gzip
+import hashlib
+import io
+import zipfile
+
+import pytest
+
+from gbdump import CHUNK_SIZE, open_roms, read_rom
+
+
+ROMS = {"a.gb": bytes(range(256)) * 130, "b.gbc": b"\x76" * 0x8000}
+
+
+def hashes(data):
+    return hashlib.md5(data).hexdigest(), hashlib.sha1(data).hexdigest()
+
+
+def roms(path, members=None):
+    return [(name, bytes(data), found)
+            for name, data, found in open_roms(str(path), members)]
+
+
+def test_read_rom_hashes_every_chunk():
+    data = ROMS["a.gb"] * (CHUNK_SIZE // len(ROMS["a.gb"]) + 2)
+    assert read_rom(io.BytesIO(data)) == (data, hashes(data))
+    assert read_rom(io.BytesIO(data), len(data)) == (data, hashes(data))
+    with pytest.raises(ValueError):
+        read_rom(io.BytesIO(data), len(data) + 1)
+
+
+def test_zip_reads_rom_members(tmp_path):
+    path = tmp_path / "set.zip"
+    with zipfile.ZipFile(str(path), "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("readme.txt", "not a ROM")
+        for name, data in ROMS.items():
+            archive.writestr(name, data)
+    assert roms(path) == [(name, data, hashes(data))
+                          for name, data in ROMS.items()]
+    assert roms(path, ["b.gbc"]) == [("b.gbc", ROMS["b.gbc"],
+                                      hashes(ROMS["b.gbc"]))]
+    with pytest.raises(ValueError):
+        roms(path, ["c.gb"])
+
+
+def test_gz_is_one_member(tmp_path):
+    path = tmp_path / "a.gb.gz"
+    with gzip.open(str(path), "wb") as f:
+        f.write(ROMS["a.gb"])
+    assert roms(path) == [("a.gb", ROMS["a.gb"], hashes(ROMS["a.gb"]))]
+
+
+def test_plain_file_has_no_members(tmp_path):
+    path = tmp_path / "a.gb"
+    path.write_bytes(ROMS["a.gb"])
+    assert roms(path) == [(None, ROMS["a.gb"], hashes(ROMS["a.gb"]))]
+    with pytest.raises(ValueError):
+        roms(path, ["a.gb"])
+
+
+def test_7z_reads_rom_members(tmp_path):
+    py7zr = pytest.importorskip("py7zr")
+    path = tmp_path / "set.7z"
+    with py7zr.SevenZipFile(str(path), "w") as archive:
+        for name, data in ROMS.items():
+            archive.writestr(data, name)
+    assert roms(path) == [(name, data, hashes(data))
+                          for name, data in ROMS.items()]
+    assert roms(path, ["b.gbc"]) == [("b.gbc", ROMS["b.gbc"],
+                                      hashes(ROMS["b.gbc"]))]
@@ -0,0 +1,63 @@
+import gzip
+import io
+
+from gbdump import CodeDataLog
+
+
+def load_trace(size, text):
+    log = CodeDataLog(size)
+    skipped = log.load_trace(io.BytesIO(text))
+    return log, skipped
+
+
+def code_offsets(log):
+    return [i for i, b in enumerate(log.bitmap) if b & CodeDataLog.CODE]
+
+
+def test_doctor_trace_marks_pc():
+    log, skipped = load_trace(0x8000,
+        b"A:01 F:B0 B:00 C:13 D:00 E:D8 H:01 L:4D SP:FFFE PC:0100 "
+        b"PCMEM:00,C3,50,01\n")
+    assert code_offsets(log) == [0x100]
+    assert skipped == 0
+
+
+def test_register_pair_is_not_a_bank():
+    log, _ = load_trace(0x8000,
+        b"AF:01B0 BC:0013 DE:00D8 HL:014D SP:FFFE PC:0100\n")
+    assert code_offsets(log) == [0x100]
+
+
+def test_bank_address_trace():
+    log, skipped = load_trace(0x10000,
+        b"00:0150  ld a,$02\n02:4005  nop\n01:7FFF\n")
+    assert code_offsets(log) == [0x150, 0x7FFF, 0x8005]
+    assert skipped == 0
+
+
+def test_bank_prefix_gives_pc_its_bank():
+    log, skipped = load_trace(0x10000, b"03:4010 A:00 PC:4010\n")
+    assert code_offsets(log) == [0xC010]
+    assert skipped == 0
+
+
+def test_banked_pc_without_bank_is_skipped():
+    log, skipped = load_trace(0x10000, b"PC:4000\nPC:0200\nPC:C000\n")
+    assert code_offsets(log) == [0x200]
+    assert skipped == 1
+
+
+def test_banked_pc_in_32k_rom_is_bank_1():
+    log, skipped = load_trace(0x8000, b"PC:4000\n")
+    assert code_offsets(log) == [0x4000]
+    assert skipped == 0
+
+
+def test_cdl_merges_flags(tmp_path):
+    path = tmp_path / "game.cdl.gz"
+    with gzip.open(str(path), "wb") as f:
+        f.write(b"CDLv2" + b"\x00" * 4 + b"\x01\x02\x07\x00")
+    log = CodeDataLog(4)
+    log.bitmap[3] = CodeDataLog.DATA
+    assert log.load(str(path)) == 0
+    assert log.bitmap == bytearray(b"\x01\x02\x03\x02")
@@ -0,0 +1,165 @@
+import sys
+
+import pytest
+
+import gbdump
+from gbdump import CPU, ROM, CodeDataLog
+
+
+#Builds a ROM of the cartridge type and size with code placed at ROM
+#offsets, where $D3, an invalid opcode, stops the interpreter
+def make_rom(code, cart_type=0x00, size=0x8000):
+    data = bytearray(b"\xD3" * size)
+    data[0x147] = cart_type
+    for offset, program in code.items():
+        data[offset:offset + len(program)] = program
+    return ROM(bytes(data))
+
+
+def run(code, cart_type=0x00, size=0x8000, instructions=10000):
+    rom = make_rom(code, cart_type, size)
+    rom.code_map = CodeDataLog(len(rom.data))
+    cpu = CPU(rom, rom.code_map)
+    cpu.count = cpu.run(instructions)
+    return cpu
+
+
+def a_and_f(cpu):
+    return cpu.r[7], cpu.r[6]
+
+
+@pytest.mark.parametrize("program, a, f", [
+    #ld A, $3A; add A, $C6
+    (b"\x3E\x3A\xC6\xC6", 0x00, 0xB0),
+    #ld A, $10; sub A, $01
+    (b"\x3E\x10\xD6\x01", 0x0F, 0x60),
+    #ld A, $FF; scf; adc A, $00
+    (b"\x3E\xFF\x37\xCE\x00", 0x00, 0xB0),
+    #ld A, $F0; and A, $0F
+    (b"\x3E\xF0\xE6\x0F", 0x00, 0xA0),
+    #ld A, $45; add A, $38; daa
+    (b"\x3E\x45\xC6\x38\x27", 0x83, 0x00),
+    #ld A, $83; sub A, $38; daa
+    (b"\x3E\x83\xD6\x38\x27", 0x45, 0x40),
+    #ld A, $99; add A, $01; daa
+    (b"\x3E\x99\xC6\x01\x27", 0x00, 0x90),
+])
+def test_alu_flags(program, a, f):
+    cpu = run({0x100: program})
+    assert a_and_f(cpu) == (a, f)
+    assert cpu.stop_reason == "invalid opcode $D3 at ${:04X}".format(
+        0x100 + len(program))
+
+
+def test_branch_cycles():
+    #xor A; jr NZ, +0; jr Z, +0
+    cpu = run({0x100: b"\xAF\x20\x00\x28\x00"})
+    assert cpu.cycles == 1 + 2 + 3
+    #xor A; call NZ, $0200; ret Z
+    cpu = run({0x100: b"\x31\xF0\xDF\xAF\xC4\x00\x02\xCD\x10\x01",
+               0x110: b"\xC8"})
+    assert cpu.pc == 0x10A
+    assert cpu.cycles == 3 + 1 + 3 + 6 + 5
+
+
+def test_call_ret_push_pop():
+    #ld SP, $DFF0; ld BC, $1234; push BC; pop DE; call $0110
+    cpu = run({0x100: b"\x31\xF0\xDF\x01\x34\x12\xC5\xD1\xCD\x10\x01",
+               #ld A, $99; push DE; pop AF, dropping F's low bits; ret
+               0x110: b"\x3E\x99\xD5\xF1\xC9"})
+    assert cpu.r[2:4] == [0x12, 0x34]
+    assert a_and_f(cpu) == (0x12, 0x30)
+    assert cpu.s[1] == 0xDFF0
+    assert cpu.mem[0xDFEE:0xDFF0] == b"\x0B\x01"
+    assert cpu.pc == 0x10B
+
+
+def test_jump_table_reaches_hidden_code():
+    code = {
+        0x100: b"\xC3\x50\x01",
+        #ld A, 1; add A, A; ld E, A; ld D, 0; ld HL, $0170; add HL, DE;
+        #ld A, [HL+]; ld H, [HL]; ld L, A; jp HL
+        0x150: b"\x3E\x01\x87\x5F\x16\x00\x21\x70\x01\x19\x2A\x66\x6F\xE9",
+        0x170: b"\x00\x00\x80\x01",
+        #ld BC, d16 hides the target from linear decoding
+        0x17F: b"\x01\x3E\x77",
+    }
+    cpu = run(code)
+    assert cpu.r[7] == 0x77
+    assert cpu.pc == 0x182
+
+    linear = make_rom(code)
+    linear.disassemble(None)
+    assert 0x180 not in [offset for offset, text, n in linear._decoded()]
+
+    rom = make_rom(code)
+    rom.code_map = CodeDataLog(len(rom.data))
+    CPU(rom, rom.code_map).run(10000)
+    assert [(offset, text) for offset, text, n in rom._decoded()
+            if offset >= 0x17F] == [(0x180, "ld A, $77")]
+
+
+@pytest.mark.parametrize("cart_type, value, bank", [
+    (0x01, 0x00, 1), (0x01, 0x02, 2), (0x13, 0x03, 3),
+    (0x19, 0x03, 3), (0x19, 0x00, 0),
+])
+def test_bank_switch_marks_rom_offset(cart_type, value, bank):
+    code = {
+        #ld A, value; ld [$2000], A; jp $4002
+        0x100: bytes([0x3E, value, 0xEA, 0x00, 0x20, 0xC3, 0x02, 0x40]),
+    }
+    #nop; nop; ld A, bank in every bank
+    for b in range(4):
+        code[b * 0x4000 + 2] = bytes([0x00, 0x00, 0x3E, b])
+    cpu = run(code, cart_type, 0x10000)
+    flags = cpu.code_map.bitmap
+    offset = bank * 0x4000
+    assert cpu.bank == bank
+    assert [flags[offset + i] for i in range(2, 8)] == [1, 1, 1, 0, 0, 0]
+    for b in range(4):
+        if b != bank:
+            assert not flags[b * 0x4000 + 4]
+
+
+def test_halt_wakes_on_vblank():
+    #ld SP, $DFF0; ld A, $01; ldh [$FF], A; ei; halt; ld B, A
+    cpu = run({0x100: b"\x31\xF0\xDF\x3E\x01\xE0\xFF\xFB\x76\x47",
+               #ld A, $55; reti
+               0x40: b"\x3E\x55\xD9"})
+    assert cpu.r[0] == 0x55
+    assert cpu.pc == 0x10A
+    assert cpu.mem[0xFF44] == 144
+    assert not cpu.mem[0xFF0F] & 0x01
+    assert cpu.code_map.bitmap[0x40] == 1
+
+
+def test_invalid_opcode_stops_run():
+    cpu = run({0x100: b"\x00\x00\xD3"})
+    assert cpu.count == 2
+    assert cpu.pc == 0x102
+    assert cpu.stop_reason == "invalid opcode $D3 at $0102"
+    assert cpu.code_map.bitmap[0x100:0x103] == b"\x01\x01\x00"
+
+
+def test_pc_wraps_past_ffff():
+    rom = make_rom({0x00: b"\x3C\x3C"})
+    cpu = CPU(rom, CodeDataLog(len(rom.data)))
+    #ld A, d8 at $FFFF reads its operand from $0000, then inc A at $0001
+    cpu.mem[0xFFFF] = 0x3E
+    cpu.pc = 0xFFFF
+    assert cpu.run(2) == 2
+    assert cpu.r[7] == 0x3D
+    assert cpu.pc == 0x0002
+    assert cpu.stop_reason is None
+
+
+def test_main_reports_stop(tmp_path, monkeypatch, capsys):
+    path = tmp_path / "game.gb"
+    path.write_bytes(bytes(make_rom({0x100: b"\x00\xD3"}).data))
+    monkeypatch.setattr(sys, "argv", ["gbdump.py", str(path),
+                                      str(tmp_path / "game.asm"),
+                                      "--run", "100"])
+    gbdump.main()
+    assert capsys.readouterr().err == ("gbdump: interpreter stopped after 1 "
+                                       "instructions: invalid opcode $D3 at "
+                                       "$0101\n")
@@ -0,0 +1,52 @@
+import io
+
+from gbdump import ROM, CodeDataLog
+
+
+#A call from $0150 to a routine at $0160 that loops 4 times
+def loop_rom():
+    data = bytearray(0x8000)
+    data[0x150:0x154] = b"\xCD\x60\x01\x76"
+    data[0x160:0x166] = b"\x06\x04\x05\x20\xFD\xC9"
+    rom = ROM(bytes(data))
+    rom.code_map = CodeDataLog(len(data))
+    for offset in (0x150, 0x153, 0x160, 0x162, 0x163, 0x165):
+        rom.code_map.bitmap[offset] = CodeDataLog.CODE
+    return rom
+
+
+def test_cycle_tables():
+    assert ROM.CYCLES[0x00] == ROM.CYCLES_NOT_TAKEN[0x00] == 1
+    assert (ROM.CYCLES[0xCD], ROM.CYCLES_NOT_TAKEN[0xCD]) == (6, 6)
+    assert (ROM.CYCLES[0xC4], ROM.CYCLES_NOT_TAKEN[0xC4]) == (6, 3)
+    assert (ROM.CYCLES[0xC0], ROM.CYCLES_NOT_TAKEN[0xC0]) == (5, 2)
+    assert (ROM.CYCLES[0x20], ROM.CYCLES_NOT_TAKEN[0x20]) == (3, 2)
+    assert (ROM.CB_CYCLES[0x46], ROM.CB_CYCLES[0x06], ROM.CB_CYCLES[0x00]) \
+        == (3, 4, 2)
+    assert ROM.CYCLE_NOTES[0x20] == " [3/2]"
+
+
+def test_cycle_annotations():
+    rom = loop_rom()
+    output = io.StringIO()
+    rom.disassemble(output, cycles=True)
+    lines = output.getvalue().splitlines()
+    assert "dec B\t;$0162 [1]" in lines
+    assert "jr NZ, $FD\t;$0163 [3/2]" in lines
+    assert "ret\t;$0165 [4]" in lines
+
+
+def test_timing_report():
+    rom = loop_rom()
+    output = io.StringIO()
+    rom.timing_report(output)
+    assert output.getvalue().splitlines() == [
+        "; Timing report, in machine cycles",
+        ";   Block 00:$0150-00:$0153\t7 cycles",
+        ";",
+        "; Routine 00:$0160\t4 instructions\t9 cycles",
+        ";   Loop 00:$0162-00:$0163\t4 cycles per iteration",
+        ";   Block 00:$0160-00:$0160\t2 cycles",
+        ";   Block 00:$0162-00:$0163\t4/3 cycles\tloop",
+        ";   Block 00:$0165-00:$0165\t4 cycles",
+    ]
@@ -0,0 +1,22 @@
+import io
+
+from gbdump import ROM, CodeDataLog, SymbolTable
+
+
+def test_data_lines_end_at_labels(tmp_path):
+    path = tmp_path / "game.sym"
+    path.write_text("00:0155 Table\n01:4008 Banked\n")
+    symbols = SymbolTable()
+    symbols.load(str(path))
+    rom = ROM(bytes(range(256)) * 128)
+    rom.code_map = CodeDataLog(len(rom.data))
+    output = io.StringIO()
+    rom.disassemble(output, symbols=symbols)
+    lines = output.getvalue().splitlines()
+    table = lines.index("Table:")
+    assert lines[table - 1].startswith("db $50, $51, $52, $53, $54\t;")
+    assert lines[table + 1].startswith("db $55, $56,")
+    banked = lines.index("Banked:")
+    assert lines[banked - 1].startswith(
+        "db $00, $01, $02, $03, $04, $05, $06, $07\t;")
+    assert lines[banked + 1].startswith("db $08,")
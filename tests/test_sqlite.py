@@ -0,0 +1,65 @@
+import sqlite3
+import sys
+
+import gbdump
+
+
+#A 32 KByte ROM of nops with a call, a load and a jump at $0150
+def write_rom(tmp_path):
+    data = bytearray(0x8000)
+    data[0x150:0x159] = b"\xCD\x60\x01\xFA\x00\xC0\xC3\x50\x01"
+    path = tmp_path / "game.gb"
+    path.write_bytes(bytes(data))
+    return str(path)
+
+
+def run_main(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["gbdump.py"] + list(argv))
+    gbdump.main()
+
+
+def table_counts(db_path):
+    db = sqlite3.connect(db_path)
+    try:
+        return [db.execute("SELECT COUNT(*) FROM " + table).fetchone()[0]
+                for table in ("roms", "instructions", "branches",
+                              "memory_refs")]
+    finally:
+        db.close()
+
+
+def test_export_without_listing(tmp_path, monkeypatch):
+    rom = write_rom(tmp_path)
+    alone = str(tmp_path / "alone.sqlite")
+    listed = str(tmp_path / "listed.sqlite")
+    run_main(monkeypatch, rom, "--sqlite", alone)
+    run_main(monkeypatch, rom, str(tmp_path / "game.asm"), "--sqlite", listed)
+    #The header at $0104-$014F is skipped and 6 bytes are in 3 instructions
+    assert table_counts(alone) == [1, 0x8000 - 0x4C - 6, 2, 1]
+    assert table_counts(listed) == table_counts(alone)
+
+
+def test_export_rows(tmp_path, monkeypatch):
+    rom = write_rom(tmp_path)
+    sym = tmp_path / "game.sym"
+    sym.write_text("00:0160 Routine\n00:C000 wCounter\n")
+    db_path = str(tmp_path / "game.sqlite")
+    run_main(monkeypatch, rom, "--sqlite", db_path, "--symbols", str(sym))
+    run_main(monkeypatch, rom, "--sqlite", db_path, "--symbols", str(sym))
+    db = sqlite3.connect(db_path)
+    try:
+        assert db.execute("SELECT COUNT(*) FROM roms").fetchone()[0] == 1
+        assert db.execute(
+            "SELECT bank, address, opcode, operand, length FROM instructions "
+            "WHERE offset = 0x150").fetchone() == (0, 0x150, 0xCD,
+                                                   b"\x60\x01", 3)
+        texts = [row[0] for row in db.execute(
+            "SELECT text FROM instructions WHERE offset IN (0x150, 0x153) "
+            "ORDER BY offset")]
+        assert "Routine" in texts[0] and "wCounter" in texts[1]
+        assert [row[0] for row in db.execute(
+            "SELECT target FROM branches ORDER BY offset")] == [0x160, 0x150]
+        assert db.execute("SELECT access, target FROM memory_refs") \
+            .fetchall() == [("read", 0xC000)]
+    finally:
+        db.close()
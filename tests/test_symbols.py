@@ -0,0 +1,63 @@
+import io
+
+from gbdump import ROM, SymbolTable
+
+
+MAP = """ROM0 bank #0:
+\tSECTION: $0150-$015f ($0010 bytes) ["Main section"]
+\t         $0150 = Main
+\t         $0158 = .loop
+ROMX bank #2:
+\tSECTION: $4000-$40ff ($0100 bytes) ["Banked"]
+\t         $4010 = BankedTable
+HRAM bank #0:
+\tSECTION: $ff80-$ff8f ($0010 bytes) ["hram"]
+\t         $ff80 = hVar
+"""
+
+
+def load(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    symbols = SymbolTable()
+    symbols.load(str(path))
+    return symbols
+
+
+def test_sym_lookup(tmp_path):
+    symbols = load(tmp_path, "game.sym",
+                   "; comment\n00:0150 Main\n01:4000 Bank1 ; trailing\n"
+                   "00:C000 wBuffer\nnot a symbol\n")
+    assert symbols.resolve(0, 0x150) == "Main"
+    assert symbols.resolve(0, 0x15A) == "Main+$A"
+    assert symbols.resolve(1, 0x4003) == "Bank1+$3"
+    assert symbols.resolve(2, 0x4003) is None
+    assert symbols.resolve(0, 0xC010) == "wBuffer+$10"
+    #Symbols never cover addresses past the end of their region
+    assert symbols.resolve(0, 0x4000) is None
+    assert symbols.resolve(0, 0x14F) is None
+
+
+def test_map_sections_bound_symbols(tmp_path):
+    symbols = load(tmp_path, "game.map", MAP)
+    assert symbols.resolve(0, 0x15A) == ".loop+$2"
+    assert symbols.resolve(0, 0x160) is None
+    assert symbols.resolve(2, 0x4000) is None
+    assert symbols.resolve(2, 0x4012) == "BankedTable+$2"
+    assert symbols.resolve(0, 0xFF81) == "hVar+$1"
+    assert "Main section" not in symbols.names
+
+
+def test_listing_uses_symbols(tmp_path):
+    symbols = load(tmp_path, "game.map", MAP)
+    data = bytearray(0x8000)
+    data[0x150:0x153] = b"\xC3\x58\x01"
+    data[0x153:0x155] = b"\xE0\x80"
+    output = io.StringIO()
+    ROM(bytes(data)).disassemble(output, symbols=symbols)
+    lines = output.getvalue().splitlines()
+    main = lines.index("Main:")
+    assert lines[main - 1] == '; SECTION "Main section"'
+    assert lines[main + 1].startswith("jp .loop\t;Main")
+    assert lines[main + 2].startswith("ldh [hVar], A\t;Main+$3")
+    assert lines[lines.index(".loop:") + 1].endswith(";.loop")